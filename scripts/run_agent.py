@@ -0,0 +1,14 @@
+from __future__ import annotations
+
+import importlib.util
+import sys
+from pathlib import Path
+
+# Allow running without `pip install -e .` (после установки доступна команда `kb-agent`)
+if importlib.util.find_spec("kb_agent") is None:
+    sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+from kb_agent.cli import main  # noqa: E402
+
+if __name__ == "__main__":
+    raise SystemExit(main())
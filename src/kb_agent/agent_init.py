@@ -3,10 +3,11 @@ from __future__ import annotations
 from pathlib import Path
 
 from langchain.agents import AgentType, initialize_agent
-from langchain.memory import ConversationBufferMemory
+from langchain.memory import ConversationBufferMemory, ConversationBufferWindowMemory
 
 from kb_agent.config import load_settings
 from kb_agent.gigachat_client import GigaChat
+from kb_agent.rate_limit import RateLimiter
 from kb_agent.tools import ToolContext, build_tools
 
 
@@ -24,9 +25,28 @@ def create_agent(
     runtime = GigaChat(gigachat_settings).build()
     llm = runtime.llm.with_retry(stop_after_attempt=4, wait_exponential_jitter=True)
 
-    memory = ConversationBufferMemory(memory_key="chat_history", return_messages=True)
+    # Окно из последних k обменов: история (и prefill) не растёт с каждым ходом.
+    # Без суммаризации: пока окно не заполнено, история только дописывается в конец (префикс стабилен).
+    if gigachat_settings.memory_window > 0:
+        memory = ConversationBufferWindowMemory(
+            k=gigachat_settings.memory_window, memory_key="chat_history", return_messages=True
+        )
+    else:
+        memory = ConversationBufferMemory(memory_key="chat_history", return_messages=True)
 
-    ctx = ToolContext(kb=kb_paths, llm=llm, request_delay_s=float(gigachat_settings.request_delay_s))
+    ctx = ToolContext(
+        kb=kb_paths,
+        llm=llm,
+        chat_model=runtime.llm,
+        request_delay_s=float(gigachat_settings.request_delay_s),
+        batch_size=gigachat_settings.batch_size,
+        fused_writer_judge=gigachat_settings.fused_writer_judge,
+        limiter=(
+            RateLimiter(rpm=gigachat_settings.rpm, tpm=gigachat_settings.tpm)
+            if gigachat_settings.rpm or gigachat_settings.tpm
+            else None
+        ),
+    )
     tools = build_tools(ctx=ctx)
 
     agent = initialize_agent(
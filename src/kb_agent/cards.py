@@ -1,37 +1,52 @@
 from __future__ import annotations
 
+import hashlib
 import json
+import os
 import re
+from collections.abc import Iterable
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
 from datetime import datetime, timezone
 from hashlib import sha256
 from pathlib import Path
-from typing import Any
+from typing import Any, NamedTuple
+
+try:  # опционально: быстрый JSON-кодек, без него работает stdlib json
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
 
 
 def utc_now_iso() -> str:
     return datetime.now(timezone.utc).isoformat()
 
 
+_HASH_BLOCK_SIZE = 4 * 1024 * 1024
+
+
 def file_sha256(path: Path) -> str:
-    h = sha256()
     with path.open("rb") as f:
-        for chunk in iter(lambda: f.read(1024 * 1024), b""):
-            h.update(chunk)
-    return h.hexdigest()
+        if hasattr(hashlib, "file_digest"):  # Python 3.11+: цикл чтения внутри C
+            return hashlib.file_digest(f, "sha256").hexdigest()
+        # Python 3.10: один буфер на весь файл, без аллокации bytes на каждый блок
+        h = sha256()
+        buf = bytearray(_HASH_BLOCK_SIZE)
+        view = memoryview(buf)
+        while n := f.readinto(buf):
+            h.update(view[:n])
+        return h.hexdigest()
+
+
+_H1_RE = re.compile(r"^[ \t]*# (.*\S)", re.MULTILINE)
+_MD_LINK_RE = re.compile(r"\[[^\]]+\]\(([^)]+)\)")
+_URL_RE = re.compile(r"https?://[^\s)>\"]+")
 
 
 def extract_title(md_text: str, fallback: str) -> str:
     # First H1
-    for line in md_text.splitlines():
-        line = line.strip()
-        if line.startswith("# "):
-            return line[2:].strip()
-    return fallback
-
-
-_MD_LINK_RE = re.compile(r"\[[^\]]+\]\(([^)]+)\)")
-_URL_RE = re.compile(r"https?://[^\s)>\"]+")
+    m = _H1_RE.search(md_text)
+    return m.group(1).strip() if m else fallback
 
 
 def extract_links(md_text: str) -> list[str]:
@@ -43,6 +58,55 @@ def extract_links(md_text: str) -> list[str]:
     return sorted(links)
 
 
+class MarkdownScan(NamedTuple):
+    sha256: str
+    title: str
+    links: list[str]
+    text: str
+
+
+def scan_markdown(path: Path) -> MarkdownScan:
+    """
+    Один проход по файлу: читаем байты один раз, из них считаем sha256 и декодируем текст,
+    по которому ищем заголовок и ссылки (вместо отдельных file_sha256 + read_text + extract_*).
+    """
+    data = path.read_bytes()
+    text = data.decode("utf-8")
+    if "\r" in text:
+        # как у read_text(): универсальные переводы строк
+        text = text.replace("\r\n", "\n").replace("\r", "\n")
+    return MarkdownScan(
+        sha256=sha256(data).hexdigest(),
+        title=extract_title(text, fallback=path.stem),
+        links=extract_links(text),
+        text=text,
+    )
+
+
+def scan_many(
+    paths: Iterable[Path], max_workers: int = 8, *, return_exceptions: bool = False
+) -> list[MarkdownScan | Exception]:
+    """
+    `scan_markdown` по многим файлам в пуле потоков (чтение и sha256 отпускают GIL).
+    Порядок результата совпадает с порядком `paths`.
+    `return_exceptions=True` — ошибка файла (не UTF-8, удалён и т.п.) возвращается на его месте, а не пробрасывается.
+    """
+
+    def _scan(path: Path) -> MarkdownScan | Exception:
+        try:
+            return scan_markdown(path)
+        except Exception as e:
+            if not return_exceptions:
+                raise
+            return e
+
+    paths = list(paths)
+    if len(paths) < 2:
+        return [_scan(p) for p in paths]
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(paths)))) as pool:
+        return list(pool.map(_scan, paths))
+
+
 @dataclass
 class KnowledgeCard:
     id: str
@@ -72,6 +136,10 @@ def card_to_dict(card: KnowledgeCard) -> dict[str, Any]:
     }
 
 
+# Каталоги, уже созданные в этом процессе: при пакетной записи mkdir не дёргается на каждый файл
+_MKDIR_DONE: set[Path] = set()
+
+
 def write_card_file(
     *,
     output_path: Path,
@@ -80,8 +148,16 @@ def write_card_file(
     source_modified_at: str | None,
     cards: list[KnowledgeCard],
     quality: dict[str, Any] | None = None,
+    pretty: bool | None = None,
 ) -> None:
-    output_path.parent.mkdir(parents=True, exist_ok=True)
+    """
+    По умолчанию JSON пишется компактно; `pretty=True` (или env `KB_PRETTY_JSON=1`) — с отступами для чтения глазами.
+    """
+    if pretty is None:
+        pretty = os.getenv("KB_PRETTY_JSON", "").strip().lower() in {"1", "true", "yes", "y", "on"}
+    if output_path.parent not in _MKDIR_DONE:
+        output_path.parent.mkdir(parents=True, exist_ok=True)
+        _MKDIR_DONE.add(output_path.parent)
     payload = {
         "schema_version": 2,
         "source": {
@@ -93,11 +169,32 @@ def write_card_file(
     }
     if quality:
         payload["quality"] = quality
-    output_path.write_text(json.dumps(payload, ensure_ascii=False, indent=2), encoding="utf-8")
+    if orjson is not None:
+        option = orjson.OPT_NON_STR_KEYS | (orjson.OPT_INDENT_2 if pretty else 0)
+        data = orjson.dumps(payload, option=option)
+    elif pretty:
+        data = json.dumps(payload, ensure_ascii=False, indent=2).encode("utf-8")
+    else:
+        data = json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    # Пишем во временный файл рядом и атомарно подменяем: прерванная запись не оставляет битую карточку
+    tmp_path = output_path.with_suffix(output_path.suffix + ".tmp")
+    try:
+        try:
+            tmp_path.write_bytes(data)
+        except FileNotFoundError:
+            # каталог удалили после того, как он попал в _MKDIR_DONE: создаём заново и пишем ещё раз
+            output_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path.write_bytes(data)
+        os.replace(tmp_path, output_path)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
 
 
 def read_json(path: Path) -> dict[str, Any]:
-    return json.loads(path.read_text(encoding="utf-8"))
+    if orjson is not None:
+        return orjson.loads(path.read_bytes())
+    return json.loads(path.read_bytes())
 
 
 def validate_card_file_payload(payload: dict[str, Any]) -> tuple[bool, str | None]:
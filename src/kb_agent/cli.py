@@ -0,0 +1,88 @@
+from __future__ import annotations
+
+import argparse
+import functools
+import sys
+from pathlib import Path
+from typing import Final
+
+from kb_agent.agent_init import create_agent
+
+# Однозадачные команды: один инструмент и сразу итог, без рассуждений по кругу.
+_SYNC_PROMPT: Final[str] = (
+    "Роль: KB-агент. Задача: вызови kb_sync_all один раз. "
+    "Без других инструментов и подтверждений. Итог: 1–2 предложения.\n"
+)
+_COVERAGE_PROMPT: Final[str] = (
+    "Роль: KB-агент. Задача: вызови kb_analyze_coverage один раз. "
+    "Итог: списки missing/stale/invalid, кратко.\n"
+)
+
+# sync/coverage — один вызов инструмента: запас на ответ и одну ошибку парсинга
+_SINGLE_TOOL_MAX_ITERATIONS = 3
+_CHAT_MAX_ITERATIONS = 20
+
+
+def _parse_args(argv: list[str] | None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="kb-agent: синхронизация knowledge_base/origins -> cards_md")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    sub.add_parser("sync", help="kb_sync_all: создать/обновить карточки по всем документам")
+    sub.add_parser("coverage", help="kb_analyze_coverage: показать missing/stale карточки")
+    chat = sub.add_parser("chat", help="произвольное сообщение агенту")
+    chat.add_argument("message", nargs="*", help="текст сообщения; без него — интерактивный режим (REPL)")
+    parser.add_argument("--quiet", action="store_true", help="не печатать шаги агента")
+    return parser.parse_args(argv)
+
+
+@functools.lru_cache(maxsize=None)
+def _get_agent(project_root: Path | None, verbose: bool, max_iterations: int):
+    """
+    Агент создаётся один раз на набор параметров: повторные вызовы (цикл, REPL) не пересобирают
+    GigaChat/tools/промпты и продолжают ту же память диалога.
+    """
+    return create_agent(project_root=project_root, verbose=verbose, max_iterations=max_iterations)
+
+
+def _ask(agent, prompt: str) -> str:
+    # Синхронный invoke: агент закэширован между вызовами, а async-клиент GigaChat (httpx.AsyncClient)
+    # привязан к первому event loop — второй asyncio.run упал бы с «Event loop is closed».
+    res = agent.invoke({"input": prompt})
+    return res["output"] if isinstance(res, dict) and "output" in res else res
+
+
+def _repl(agent) -> int:
+    print("kb-agent chat: пустая строка или Ctrl+D — выход.")
+    for line in sys.stdin:
+        prompt = line.strip()
+        if not prompt:
+            break
+        print(_ask(agent, prompt))
+    return 0
+
+
+def main(argv: list[str] | None = None) -> int:
+    args = _parse_args(argv)
+
+    if hasattr(sys.stdout, "reconfigure"):
+        try:
+            sys.stdout.reconfigure(encoding="utf-8")
+            sys.stderr.reconfigure(encoding="utf-8")
+        except Exception:
+            pass
+
+    if args.cmd == "sync":
+        prompt, max_iterations = _SYNC_PROMPT, _SINGLE_TOOL_MAX_ITERATIONS
+    elif args.cmd == "coverage":
+        prompt, max_iterations = _COVERAGE_PROMPT, _SINGLE_TOOL_MAX_ITERATIONS
+    else:
+        prompt, max_iterations = " ".join(args.message), _CHAT_MAX_ITERATIONS
+
+    agent, _ctx = _get_agent(None, not args.quiet, max_iterations)
+    if args.cmd == "chat" and not prompt:
+        return _repl(agent)
+    print(_ask(agent, prompt))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
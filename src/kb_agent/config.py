@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+import functools
 import os
 from dataclasses import dataclass
 from pathlib import Path
@@ -33,15 +34,31 @@ class GigaChatSettings:
     verify_ssl_certs: bool
     timeout_s: float
     request_delay_s: float
+    # Сколько последних обменов (вопрос+ответ) держать в памяти агента; 0 — вся история.
+    memory_window: int = 4
+    # Сколько запросов к модели отправлять параллельно в пакетных вызовах (llm.batch)
+    batch_size: int = 4
+    # Лимиты провайдера (запросов/токенов в минуту); 0 — не задан, тогда темп задаёт request_delay_s
+    rpm: float = 0.0
+    tpm: float = 0.0
+    # Писатель и судья одним запросом (карточки + самопроверка) вместо двух
+    fused_writer_judge: bool = False
 
 
 def load_settings(project_root: Path | None = None) -> tuple[GigaChatSettings, KBPaths]:
     """
     Loads settings from `.env` (if present) and environment variables.
+
+    The result is memoized per resolved project root; call `load_settings.cache_clear()`
+    after changing the environment or `.env`.
     """
     if project_root is None:
         project_root = Path.cwd()
+    return _load_settings_cached(project_root.resolve())
+
 
+@functools.lru_cache(maxsize=8)
+def _load_settings_cached(project_root: Path) -> tuple[GigaChatSettings, KBPaths]:
     # `.env` может отсутствовать — это нормально.
     load_dotenv(project_root / ".env", override=False)
 
@@ -56,6 +73,11 @@ def load_settings(project_root: Path | None = None) -> tuple[GigaChatSettings, K
     verify_ssl_certs = _env_bool("GIGACHAT_VERIFY_SSL_CERTS", False)
     timeout_s = float(os.getenv("GIGACHAT_TIMEOUT", "60"))
     request_delay_s = float(os.getenv("GIGACHAT_REQUEST_DELAY_S", "0"))
+    memory_window = int(os.getenv("GIGACHAT_MEMORY_WINDOW", "4"))
+    batch_size = int(os.getenv("GIGACHAT_BATCH_SIZE", "4"))
+    rpm = float(os.getenv("GIGACHAT_RPM", "0"))
+    tpm = float(os.getenv("GIGACHAT_TPM", "0"))
+    fused_writer_judge = _env_bool("GIGACHAT_FUSED_WRITER_JUDGE", False)
 
     kb_root = Path(os.getenv("KB_ROOT", "knowledge_base"))
     origins_dir = kb_root / os.getenv("KB_ORIGINS_DIR", "origins")
@@ -73,8 +95,14 @@ def load_settings(project_root: Path | None = None) -> tuple[GigaChatSettings, K
             verify_ssl_certs=verify_ssl_certs,
             timeout_s=timeout_s,
             request_delay_s=request_delay_s,
+            memory_window=memory_window,
+            batch_size=batch_size,
+            rpm=rpm,
+            tpm=tpm,
+            fused_writer_judge=fused_writer_judge,
         ),
         KBPaths(root=kb_root, origins_dir=origins_dir, cards_dir=cards_dir, cards_md_dir=cards_md_dir),
     )
 
 
+load_settings.cache_clear = _load_settings_cached.cache_clear  # type: ignore[attr-defined]
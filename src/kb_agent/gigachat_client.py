@@ -6,6 +6,9 @@ from langchain_gigachat.chat_models import GigaChat as LangchainGigaChat
 
 from kb_agent.config import GigaChatSettings
 
+# InsecureRequestWarning уже отключён в этом процессе
+_warnings_disabled = False
+
 
 @dataclass(frozen=True)
 class GigaChatRuntime:
@@ -39,12 +42,14 @@ class GigaChat:
         if credentials.lower().startswith("basic "):
             credentials = credentials.split(" ", 1)[1].strip()
 
-        if not self.settings.verify_ssl_certs:
-            # Убираем шумный warning при verify_ssl_certs=false
+        global _warnings_disabled
+        if not _warnings_disabled and not self.settings.verify_ssl_certs:
+            # Убираем шумный warning при verify_ssl_certs=false (один раз на процесс)
             try:  # pragma: no cover
                 import urllib3
 
                 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+                _warnings_disabled = True
             except Exception:
                 pass
 
@@ -4,6 +4,8 @@ import uuid
 from dataclasses import dataclass
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 
 @dataclass(frozen=True)
@@ -12,6 +14,31 @@ class OAuthToken:
     expires_at: int | None = None
 
 
+def _build_session() -> requests.Session:
+    """
+    Shared session: keeps the TLS connection to the OAuth endpoint alive between token fetches.
+    """
+    session = requests.Session()
+    session.headers.update(
+        {
+            "Content-Type": "application/x-www-form-urlencoded",
+            "Accept": "application/json",
+        }
+    )
+    retry = Retry(
+        total=3,
+        backoff_factor=0.3,
+        status_forcelist=[429, 500, 502, 503, 504],
+        allowed_methods=frozenset({"POST"}),
+        raise_on_status=False,
+    )
+    session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=4, max_retries=retry))
+    return session
+
+
+_SESSION = _build_session()
+
+
 def fetch_gigachat_access_token(
     *,
     oauth_url: str,
@@ -28,13 +55,11 @@ def fetch_gigachat_access_token(
         rq_uid = str(uuid.uuid4())
 
     headers = {
-        "Content-Type": "application/x-www-form-urlencoded",
-        "Accept": "application/json",
         "RqUID": rq_uid,
         "Authorization": f"Basic {authorization_key}",
     }
 
-    resp = requests.post(
+    resp = _SESSION.post(
         oauth_url,
         headers=headers,
         data={"scope": scope},
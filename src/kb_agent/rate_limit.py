@@ -0,0 +1,67 @@
+from __future__ import annotations
+
+import threading
+import time
+
+
+class RateLimiter:
+    """
+    Общий (потокобезопасный) token bucket для запросов к LLM.
+
+    - **rpm**: запросов в минуту; `burst` — сколько запросов можно отправить подряд после простоя.
+    - **tpm**: (опционально) токенов в минуту; запрос «стоит» столько, сколько оценено в `acquire`.
+
+    В отличие от фиксированной паузы перед каждым вызовом, ждём только когда корзина пуста:
+    в простое запрос уходит сразу, под параллельной нагрузкой — ровно с темпом провайдера.
+    """
+
+    def __init__(self, rpm: float | None = None, tpm: float | None = None, *, burst: int = 1):
+        self.rpm = rpm if rpm and rpm > 0 else None
+        self.tpm = tpm if tpm and tpm > 0 else None
+        self._req_capacity = float(max(1, burst))
+        self._req_tokens = self._req_capacity
+        self._tok_capacity = float(self.tpm or 0)
+        self._tok_tokens = self._tok_capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_delay(cls, delay_s: float) -> RateLimiter | None:
+        """
+        Эквивалент старой паузы `request_delay_s`: не чаще одного запроса в `delay_s` секунд.
+        """
+        if not delay_s or delay_s <= 0:
+            return None
+        return cls(rpm=60.0 / float(delay_s))
+
+    def _refill(self, now: float) -> None:
+        elapsed = now - self._updated
+        self._updated = now
+        if self.rpm:
+            self._req_tokens = min(self._req_capacity, self._req_tokens + elapsed * self.rpm / 60.0)
+        if self.tpm:
+            self._tok_tokens = min(self._tok_capacity, self._tok_tokens + elapsed * self.tpm / 60.0)
+
+    def acquire(self, estimated_tokens: int = 0) -> None:
+        """
+        Блокирует поток, пока в корзине не наберётся один запрос (и `estimated_tokens` токенов).
+        """
+        if not self.rpm and not self.tpm:
+            return
+        # запрос больше минутного лимита токенов иначе ждал бы вечно
+        cost = min(float(max(0, estimated_tokens)), self._tok_capacity) if self.tpm else 0.0
+        while True:
+            with self._lock:
+                self._refill(time.monotonic())
+                wait = 0.0
+                if self.rpm and self._req_tokens < 1.0:
+                    wait = max(wait, (1.0 - self._req_tokens) * 60.0 / self.rpm)
+                if self.tpm and self._tok_tokens < cost:
+                    wait = max(wait, (cost - self._tok_tokens) * 60.0 / self.tpm)
+                if wait <= 0.0:
+                    if self.rpm:
+                        self._req_tokens -= 1.0
+                    if self.tpm:
+                        self._tok_tokens -= cost
+                    return
+            time.sleep(wait)
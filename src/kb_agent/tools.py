@@ -1,42 +1,207 @@
 from __future__ import annotations
 
+import functools
 import json
-import time
-from dataclasses import dataclass
+import os
+import re
+import threading
+from collections import OrderedDict
+from collections.abc import Iterator
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
 from datetime import datetime, timezone
-from hashlib import sha256
+from hashlib import blake2b, sha256
 from pathlib import Path
 from typing import Any
 
 from langchain.tools import StructuredTool
 from pydantic import BaseModel, Field
 from langchain_core.output_parsers import PydanticOutputParser
+from langchain_core.runnables import RunnableLambda
 
-from kb_agent.cards import extract_title, file_sha256, utc_now_iso
+try:  # опционально: быстрый JSON-кодек, без него работает stdlib json
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+try:  # опционально: точный подсчёт токенов; без него — оценка по символам
+    import tiktoken
+except ImportError:  # pragma: no cover
+    tiktoken = None
+
+try:  # опционально: поиск всех цитат судьи за один проход по документу
+    import ahocorasick
+except ImportError:  # pragma: no cover
+    ahocorasick = None
+
+from kb_agent.cards import MarkdownScan, file_sha256, scan_many, scan_markdown
 from kb_agent.config import KBPaths
+from kb_agent.rate_limit import RateLimiter
+
+
+# Сколько отсканированных документов (с полным текстом) держать в ToolContext._md_cache
+_MD_CACHE_MAXSIZE = 256
+# Сколько документов держать в ToolContext._cards_cache
+_CARDS_CACHE_MAXSIZE = 256
+
+_DEFAULT_ROLE = (
+    "Ты агент по обслуживанию базы знаний. "
+    "Твоя задача: синхронизировать markdown из knowledge_base/origins с JSON карточками в knowledge_base/cards. "
+    "Если полезно, можешь менять свою роль/фокус через инструмент kb_set_role."
+)
 
 
-@dataclass
+# slots: контекст читается на каждом вызове инструмента; не frozen — kb_set_role меняет role
+@dataclass(slots=True)
 class ToolContext:
     kb: KBPaths
     llm: Any  # LangChain chat model
     request_delay_s: float = 0.0
-    role: str = (
-        "Ты агент по обслуживанию базы знаний. "
-        "Твоя задача: синхронизировать markdown из knowledge_base/origins с JSON карточками в knowledge_base/cards. "
-        "Если полезно, можешь менять свою роль/фокус через инструмент kb_set_role."
+    # Сколько запросов писателя держать одновременно в `llm.batch` при kb_sync_all
+    batch_size: int = 4
+    # Сколько документов kb_sync_all обрабатывает одновременно (судья/доработка/запись);
+    # им же ограничены пулы файлового IO (kb_analyze_coverage, запись карточек)
+    parallelism: int = 4
+    # Писатель и судья одним вызовом: карточки + самопроверка с цитатами (судья отдельно не вызывается)
+    fused_writer_judge: bool = False
+    # Короткие документы kb_sync_all упаковывает в один запрос писателя, пока их суммарная длина
+    # не превышает этот бюджет (символы); 0 — каждый документ отдельным запросом
+    multi_doc_chars: int = 12000
+    role: str = _DEFAULT_ROLE
+    # Общий лимит RPM/TPM на все вызовы LLM; если не задан — строится из request_delay_s
+    limiter: RateLimiter | None = None
+    # Базовая чат-модель (без with_retry/with_config) для with_structured_output; None — ctx.llm
+    chat_model: Any = None
+    # Ответы писателя/судьи через нативный structured output; None — определить по модели.
+    # Разбор текста с репромптом остаётся запасным путём.
+    structured_output: bool | None = None
+    # origin_rel_path -> ((mtime_ns, size), MarkdownScan): повторные чтения неизменённых документов бесплатны
+    # LRU на _MD_CACHE_MAXSIZE документов: полный текст не копится весь срок жизни процесса (REPL)
+    _md_cache: OrderedDict[str, tuple[tuple[int, int], MarkdownScan]] = field(default_factory=OrderedDict, repr=False)
+    _md_cache_lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+    # origin_rel_path -> ((source_sha256, role_hash), (карточки, quality)): повторный sync в том же процессе без LLM
+    # Одна запись на документ (новая версия вытесняет старую), LRU на _CARDS_CACHE_MAXSIZE документов
+    _cards_cache: OrderedDict[str, tuple[tuple[str, str], tuple[list[dict[str, Any]], dict[str, Any] | None]]] = (
+        field(default_factory=OrderedDict, repr=False)
+    )
+    _cards_cache_lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+    # pydantic-модель ответа -> chat_model.with_structured_output(model)
+    _structured_cache: dict[type[BaseModel], Any] = field(default_factory=dict, repr=False)
+    # resolve() каталогов knowledge_base — один раз, а не на каждый файл
+    _root_resolved: Path = field(init=False, repr=False)
+    _origins_resolved: Path = field(init=False, repr=False)
+
+    def __post_init__(self) -> None:
+        self._root_resolved = self.kb.root.resolve()
+        self._origins_resolved = self.kb.origins_dir.resolve()
+        if self.limiter is None:
+            self.limiter = RateLimiter.from_delay(self.request_delay_s)
+        if self.chat_model is None:
+            self.chat_model = self.llm
+        if self.structured_output is None:
+            self.structured_output = callable(getattr(self.chat_model, "with_structured_output", None))
+
+    @property
+    def role_hash(self) -> str:
+        # роль входит в промпт писателя, поэтому после kb_set_role кэш карточек не должен срабатывать
+        return sha256(self.role.encode("utf-8")).hexdigest()[:16]
+
+
+def _cached_scan(ctx: ToolContext, origin_rel_path: str, st: os.stat_result) -> MarkdownScan | None:
+    with ctx._md_cache_lock:
+        hit = ctx._md_cache.get(origin_rel_path)
+        if hit is not None and hit[0] == (st.st_mtime_ns, st.st_size):
+            ctx._md_cache.move_to_end(origin_rel_path)
+            return hit[1]
+    return None
+
+
+def _remember_scan(ctx: ToolContext, origin_rel_path: str, st: os.stat_result, scan: MarkdownScan) -> None:
+    with ctx._md_cache_lock:
+        ctx._md_cache[origin_rel_path] = ((st.st_mtime_ns, st.st_size), scan)
+        ctx._md_cache.move_to_end(origin_rel_path)
+        while len(ctx._md_cache) > _MD_CACHE_MAXSIZE:
+            ctx._md_cache.popitem(last=False)
+
+
+def _cached_cards(
+    ctx: ToolContext, origin_rel_path: str, md_hash: str
+) -> tuple[list[dict[str, Any]], dict[str, Any] | None] | None:
+    with ctx._cards_cache_lock:
+        hit = ctx._cards_cache.get(origin_rel_path)
+        if hit is not None and hit[0] == (md_hash, ctx.role_hash):
+            ctx._cards_cache.move_to_end(origin_rel_path)
+            return hit[1]
+    return None
+
+
+def _remember_cards(
+    ctx: ToolContext,
+    origin_rel_path: str,
+    md_hash: str,
+    raw_cards: list[dict[str, Any]],
+    quality: dict[str, Any] | None,
+) -> None:
+    with ctx._cards_cache_lock:
+        ctx._cards_cache[origin_rel_path] = ((md_hash, ctx.role_hash), (raw_cards, quality))
+        ctx._cards_cache.move_to_end(origin_rel_path)
+        while len(ctx._cards_cache) > _CARDS_CACHE_MAXSIZE:
+            ctx._cards_cache.popitem(last=False)
+
+
+def _scan_origin(ctx: ToolContext, origin_rel_path: str, path: Path) -> tuple[MarkdownScan, os.stat_result]:
+    st = path.stat()
+    scan = _cached_scan(ctx, origin_rel_path, st)
+    if scan is None:
+        scan = scan_markdown(path)
+        _remember_scan(ctx, origin_rel_path, st, scan)
+    return scan, st
+
+
+def _scan_origins(ctx: ToolContext, items: list[tuple[str, Path]]) -> list[MarkdownScan | Exception]:
+    """
+    Как `_scan_origin` для многих файлов: промахи кэша читаются параллельно через `scan_many`.
+    Ошибка отдельного файла возвращается на его месте (исключение), остальные файлы сканируются.
+    """
+    out: list[MarkdownScan | Exception | None] = []
+    stats: list[os.stat_result | None] = []
+    for rel, p in items:
+        try:
+            st = p.stat()
+        except OSError as e:
+            stats.append(None)
+            out.append(e)
+            continue
+        stats.append(st)
+        out.append(_cached_scan(ctx, rel, st))
+    misses = [i for i, scan in enumerate(out) if scan is None]
+    fresh = scan_many(
+        (items[i][1] for i in misses), max_workers=max(1, int(ctx.parallelism)), return_exceptions=True
     )
+    for i, scan in zip(misses, fresh):
+        st = stats[i]
+        if isinstance(scan, MarkdownScan) and st is not None:
+            _remember_scan(ctx, items[i][0], st, scan)
+        out[i] = scan
+    return out  # type: ignore[return-value]
 
 
 def _resolve_origin(ctx: ToolContext, rel_path: str) -> Path:
     p = (ctx.kb.origins_dir / rel_path).resolve()
-    if not str(p).startswith(str(ctx.kb.origins_dir.resolve())):
+    if not p.is_relative_to(ctx._origins_resolved):
         raise ValueError("Path escapes origins_dir")
     return p
 
 
+def _relative_to(path: Path, base: Path, base_resolved: Path) -> Path:
+    # файлы из _walk_files лежат под base буквально — без resolve() (и его системных вызовов)
+    if path.is_relative_to(base):
+        return path.relative_to(base)
+    return path.resolve().relative_to(base_resolved)
+
+
 def _origin_rel(ctx: ToolContext, path: Path) -> str:
-    return path.resolve().relative_to(ctx.kb.origins_dir.resolve()).as_posix()
+    return _relative_to(path, ctx.kb.origins_dir, ctx._origins_resolved).as_posix()
 
 
 def _card_path_for_origin(ctx: ToolContext, origin_rel_path: str) -> Path:
@@ -45,17 +210,50 @@ def _card_path_for_origin(ctx: ToolContext, origin_rel_path: str) -> Path:
     return (ctx.kb.cards_dir / rel).with_suffix(".json")
 
 
+def _walk_files(root: Path, suffixes: set[str]) -> Iterator[tuple[str, os.DirEntry[str]]]:
+    """
+    Рекурсивный обход через os.scandir: тип файла берётся из DirEntry, без stat на каждую запись (как в rglob).
+    `suffixes` — расширения без точки в нижнем регистре.
+    """
+    stack = [str(root)]
+    while stack:
+        try:
+            it = os.scandir(stack.pop())
+        except OSError:
+            continue
+        with it:
+            for entry in it:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif "." in entry.name and entry.name.rsplit(".", 1)[-1].lower() in suffixes and entry.is_file():
+                    yield entry.path, entry
+
+
 def _list_markdown_files(ctx: ToolContext) -> list[Path]:
-    if not ctx.kb.origins_dir.exists():
-        return []
-    exts = {".md", ".yml", ".yaml"}
-    return sorted([p for p in ctx.kb.origins_dir.rglob("*") if p.is_file() and p.suffix.lower() in exts])
+    return sorted(Path(p) for p, _ in _walk_files(ctx.kb.origins_dir, {"md", "yml", "yaml"}))
 
 
 def _list_card_files(ctx: ToolContext) -> list[Path]:
-    if not ctx.kb.cards_md_dir.exists():
-        return []
-    return sorted([p for p in ctx.kb.cards_md_dir.rglob("*.md") if p.is_file() and p.name != ".gitkeep"])
+    return sorted(Path(p) for p, _ in _walk_files(ctx.kb.cards_md_dir, {"md"}))
+
+
+def _card_files_by_stem(ctx: ToolContext) -> dict[str, list[Path]]:
+    """
+    Индекс `card_{id}_{stem}.md` -> stem за один scandir вместо glob на каждый документ.
+    """
+    index: dict[str, list[Path]] = {}
+    try:
+        it = os.scandir(ctx.kb.cards_md_dir)
+    except OSError:
+        return index
+    with it:
+        for entry in it:
+            name = entry.name
+            if name.startswith("card_") and name.endswith(".md") and name.count("_") >= 2 and entry.is_file():
+                index.setdefault(name.split("_", 2)[2][:-3], []).append(Path(entry.path))
+    for paths in index.values():
+        paths.sort()
+    return index
 
 
 def kb_read_directory(ctx: ToolContext, relative_to_kb_root: bool = True) -> dict[str, Any]:
@@ -68,7 +266,7 @@ def kb_read_directory(ctx: ToolContext, relative_to_kb_root: bool = True) -> dic
 
     def _fmt(p: Path) -> str:
         if relative_to_kb_root:
-            return p.resolve().relative_to(root.resolve()).as_posix()
+            return _relative_to(p, root, ctx._root_resolved).as_posix()
         return str(p)
 
     return {
@@ -85,10 +283,10 @@ def kb_read_markdown(ctx: ToolContext, origin_rel_path: str, max_chars: int = 12
     if not origin_rel_path:
         raise ValueError("origin_rel_path is required")
     path = _resolve_origin(ctx, origin_rel_path)
-    text = path.read_text(encoding="utf-8")
+    scan, stat = _scan_origin(ctx, origin_rel_path, path)
+    text = scan.text
     if len(text) > max_chars:
         text = text[:max_chars] + "\n\n[TRUNCATED]"
-    stat = path.stat()
     return {
         "path": origin_rel_path,
         "size_bytes": stat.st_size,
@@ -97,47 +295,74 @@ def kb_read_markdown(ctx: ToolContext, origin_rel_path: str, max_chars: int = 12
     }
 
 
+# маркер источника пишется последней строкой карточки; берём последнее вхождение
+_SHA_RE = re.compile(rb".*source_sha256:\s*([0-9a-f]{32,64})", re.DOTALL)
+_SHA_TAIL_BYTES = 512
+
+
+def _extract_sha_from_md_card(path: Path) -> str | None:
+    # ожидаем HTML-комментарий в конце: <!-- source_sha256: <hex> --> — читаем только хвост файла
+    with path.open("rb") as f:
+        size = f.seek(0, os.SEEK_END)
+        f.seek(max(0, size - _SHA_TAIL_BYTES))
+        tail = f.read()
+    m = _SHA_RE.match(tail)
+    return m.group(1).decode("ascii") if m else None
+
+
+def _cards_up_to_date(card_files: list[Path], md_hash: str) -> bool:
+    """
+    True, если карточки документа есть и все собраны из текущей версии (sha256 в маркере совпадает).
+    """
+    if not card_files:
+        return False
+    for cf in card_files:
+        try:
+            if _extract_sha_from_md_card(cf) != md_hash:
+                return False
+        except Exception:
+            return False
+    return True
+
+
 def kb_analyze_coverage(ctx: ToolContext, include_stale: bool = True) -> dict[str, Any]:
     md_files = _list_markdown_files(ctx)
-    missing: list[str] = []
     stale: list[str] = []
     invalid: list[str] = []
 
-    def _extract_sha_from_md_card(text: str) -> str | None:
-        # ожидаем HTML-комментарий в конце: <!-- source_sha256: <hex> -->
-        marker = "source_sha256:"
-        idx = text.rfind(marker)
-        if idx == -1:
-            return None
-        tail = text[idx + len(marker) :].strip()
-        sha = tail.split()[0].strip()
-        return sha if len(sha) >= 32 else None
-
-    for md in md_files:
-        rel = _origin_rel(ctx, md)
-        stem = Path(rel).stem
-        card_files = list(ctx.kb.cards_md_dir.glob(f"card_*_{stem}.md")) if ctx.kb.cards_md_dir.exists() else []
-        if not card_files:
-            missing.append(rel)
-            continue
+    rels = [_origin_rel(ctx, md) for md in md_files]
+    # один проход по cards_md вместо glob по всему каталогу на каждый документ
+    card_index = _card_files_by_stem(ctx)
+    card_lists = [card_index.get(Path(rel).stem, []) for rel in rels]
+    missing: list[str] = [rel for rel, card_files in zip(rels, card_lists) if not card_files]
+
+    if include_stale:
+        present = [i for i, card_files in enumerate(card_lists) if card_files]
+        all_cards = [cf for i in present for cf in card_lists[i]]
 
-        if include_stale:
-            current_hash = file_sha256(md)
+        def _card_sha(cf: Path) -> str | BaseException | None:
+            try:
+                return _extract_sha_from_md_card(cf)
+            except Exception as e:
+                return e
+
+        # sha256 документов и чтение карточек — блокирующий IO, отпускающий GIL: делаем пулом потоков
+        with ThreadPoolExecutor(max_workers=max(1, int(ctx.parallelism))) as pool:
+            hashes = dict(zip(present, pool.map(file_sha256, [md_files[i] for i in present])))
+            card_shas = dict(zip(all_cards, pool.map(_card_sha, all_cards)))
+
+        for i in present:
+            current_hash = hashes[i]
             # stale если хотя бы одна карточка не содержит sha или sha не совпадает
-            bad = False
-            for cf in card_files:
-                try:
-                    txt = cf.read_text(encoding="utf-8")
-                    sha = _extract_sha_from_md_card(txt)
-                    if not sha or sha != current_hash:
-                        bad = True
-                        break
-                except Exception as e:
-                    invalid.append(f"{rel}: {cf.name}: {type(e).__name__}: {e}")
-                    bad = True
+            for cf in card_lists[i]:
+                sha = card_shas[cf]
+                if isinstance(sha, BaseException):
+                    invalid.append(f"{rels[i]}: {cf.name}: {type(sha).__name__}: {sha}")
+                    stale.append(rels[i])
+                    break
+                if not sha or sha != current_hash:
+                    stale.append(rels[i])
                     break
-            if bad:
-                stale.append(rel)
 
     return {
         "origins_total": len(md_files),
@@ -156,34 +381,131 @@ def kb_set_role(ctx: ToolContext, role: str) -> dict[str, Any]:
     return {"ok": True, "before": before, "after": ctx.role}
 
 
-def _invoke_llm_text(ctx: ToolContext, prompt: str) -> str:
-    if ctx.request_delay_s and ctx.request_delay_s > 0:
-        time.sleep(float(ctx.request_delay_s))
-    msg = ctx.llm.invoke(prompt)
+def _dumps(obj: Any) -> str:
+    if orjson is not None:
+        return orjson.dumps(obj).decode("utf-8")
+    return json.dumps(obj, ensure_ascii=False)
+
+
+def _loads(text: str) -> Any:
+    return orjson.loads(text) if orjson is not None else json.loads(text)
+
+
+def _message_text(msg: Any) -> str:
     content = getattr(msg, "content", msg)
     if isinstance(content, list):
         content = "".join(str(x) for x in content)
     return str(content).strip()
 
 
-def _llm_parse_pydantic(ctx: ToolContext, *, prompt: str, model: type[BaseModel], attempts: int = 3) -> BaseModel:
+def _throttle(ctx: ToolContext, prompt: str) -> str:
+    if ctx.limiter is not None:
+        # грубая оценка токенов: ~4 символа на токен
+        ctx.limiter.acquire(estimated_tokens=len(prompt) // 4)
+    return prompt
+
+
+def _invoke_llm_text(ctx: ToolContext, prompt: str) -> str:
+    return _message_text(ctx.llm.invoke(_throttle(ctx, prompt)))
+
+
+def _invoke_llm_texts(ctx: ToolContext, prompts: list[str]) -> list[str | None]:
+    """
+    Пакетный вызов: все промпты уходят через `llm.batch` (до ctx.batch_size одновременно).
+    Для упавших элементов возвращает None, порядок совпадает с `prompts`.
+    """
+    if not prompts:
+        return []
+    # лимитер срабатывает на каждый элемент пакета отдельно, прямо перед его отправкой
+    chain = RunnableLambda(lambda p: _throttle(ctx, p)) | ctx.llm
+    msgs = chain.batch(prompts, config={"max_concurrency": max(1, int(ctx.batch_size))}, return_exceptions=True)
+    return [None if isinstance(m, Exception) else _message_text(m) for m in msgs]
+
+
+def _structured_llm(ctx: ToolContext, model: type[BaseModel]) -> Any | None:
+    """
+    Runnable, возвращающий сразу экземпляр `model`, или None, если модель structured output не умеет.
+    """
+    if not ctx.structured_output:
+        return None
+    runnable = ctx._structured_cache.get(model)
+    if runnable is None:
+        try:
+            runnable = ctx.chat_model.with_structured_output(model)
+        except (NotImplementedError, AttributeError, TypeError, ValueError):
+            ctx.structured_output = False
+            return None
+        ctx._structured_cache[model] = runnable
+    return runnable
+
+
+# 4xx, которые говорят не «модель не умеет», а «повтори позже/проверь доступ» — их не считаем отказом от функции
+_TRANSIENT_STATUSES = frozenset({401, 403, 408, 409, 429})
+
+
+def _structured_unsupported(e: Exception) -> bool:
     """
-    Надёжный разбор ответа через PydanticOutputParser + репромпт при ошибках.
+    Ошибка означает, что провайдер/модель не поддерживает structured output (а не разовый сбой).
     """
+    if isinstance(e, NotImplementedError):
+        return True
+    # httpx/openai-стиль: e.status_code; gigachat.ResponseError: args = (url, status_code, content, headers)
+    status = getattr(e, "status_code", None)
+    if status is None and len(e.args) >= 2 and isinstance(e.args[1], int):
+        status = e.args[1]
+    return isinstance(status, int) and 400 <= status < 500 and status not in _TRANSIENT_STATUSES
+
+
+def _invoke_structured(ctx: ToolContext, prompt: str, model: type[BaseModel]) -> BaseModel | None:
+    runnable = _structured_llm(ctx, model)
+    if runnable is None:
+        return None
+    try:
+        out = runnable.invoke(_throttle(ctx, prompt))
+    except Exception as e:
+        if _structured_unsupported(e):
+            # дальше сразу текстовый путь: иначе каждый вызов стоил бы два запроса к LLM
+            ctx.structured_output = False
+        return None
+    return out if isinstance(out, model) else None
+
+
+def _llm_parse_pydantic(
+    ctx: ToolContext,
+    *,
+    prompt: str,
+    model: type[BaseModel],
+    attempts: int = 3,
+    first_text: str | None = None,
+    structured: bool = True,
+) -> BaseModel:
+    """
+    Ответ LLM как экземпляр `model`: сначала нативный structured output (если модель умеет),
+    иначе/при сбое — разбор через PydanticOutputParser + репромпт при ошибках.
+    `first_text` — уже полученный текстовый ответ на первую попытку (например, из пакетного вызова);
+    `structured=False` — сразу текстовый путь (structured output уже пробовали).
+    """
+    if structured and first_text is None:
+        obj = _invoke_structured(ctx, prompt, model)
+        if obj is not None:
+            return obj
     parser = PydanticOutputParser(pydantic_object=model)
     fmt = parser.get_format_instructions()
     full_prompt = f"{prompt}\n\n{fmt}\n"
 
     last_text = ""
     for i in range(attempts):
-        last_text = _invoke_llm_text(ctx, full_prompt)
+        if i == 0 and first_text is not None:
+            last_text = first_text
+        else:
+            last_text = _invoke_llm_text(ctx, full_prompt)
         try:
             # Иногда модель возвращает JSON Schema вместо объекта значений.
             try:
-                obj = json.loads(last_text)
+                obj = _loads(last_text)
                 if isinstance(obj, dict) and ("properties" in obj and ("required" in obj or "$defs" in obj)):
                     raise ValueError("Model returned JSON schema, not values")
-            except json.JSONDecodeError:
+            except json.JSONDecodeError:  # orjson.JSONDecodeError — его подкласс
                 pass
             return parser.parse(last_text)
         except Exception:
@@ -198,6 +520,37 @@ def _llm_parse_pydantic(ctx: ToolContext, *, prompt: str, model: type[BaseModel]
     raise RuntimeError("unreachable")
 
 
+def _llm_parse_pydantic_many(
+    ctx: ToolContext, *, jobs: list[tuple[str, type[BaseModel]]], attempts: int = 3
+) -> list[BaseModel | None]:
+    """
+    `jobs` — пары (prompt, pydantic-модель ответа).
+    Первая попытка для всех промптов — одним пакетом (structured output, если модель умеет, иначе текст
+    через `llm.batch`); репромпты (редкие) идут по одному.
+    Для промптов, которые так и не разобрались, возвращает None.
+    """
+    out: list[BaseModel | None] = [None] * len(jobs)
+    todo = list(range(len(jobs)))
+    if ctx.structured_output and jobs:
+        chain = RunnableLambda(lambda job: _invoke_structured(ctx, job[0], job[1]))
+        out = chain.batch(jobs, config={"max_concurrency": max(1, int(ctx.batch_size))})
+        # где structured output не сработал — разбор текста, как без него
+        todo = [i for i, r in enumerate(out) if r is None]
+    if not todo:
+        return out
+    fmts = {m: PydanticOutputParser(pydantic_object=m).get_format_instructions() for _, m in jobs}
+    texts = _invoke_llm_texts(ctx, [f"{jobs[i][0]}\n\n{fmts[jobs[i][1]]}\n" for i in todo])
+    for i, text in zip(todo, texts):
+        prompt, model = jobs[i]
+        try:
+            out[i] = _llm_parse_pydantic(
+                ctx, prompt=prompt, model=model, attempts=attempts, first_text=text, structured=False
+            )
+        except Exception:
+            out[i] = None
+    return out
+
+
 class CardDraft(BaseModel):
     title: str = Field(description="Заголовок карточки")
     description: str = Field(description="Короткое описание карточки (1-2 предложения) — пойдет в блок между -- --")
@@ -209,10 +562,14 @@ class CardDraft(BaseModel):
 
 
 class WriterResult(BaseModel):
+    """Карточки знаний, на которые разбит один документ."""
+
     cards: list[CardDraft] = Field(description="Список карточек (1..20)")
 
 
 class JudgeResult(BaseModel):
+    """Оценка судьи: покрывают ли карточки документ и что в них потеряно (с цитатами)."""
+
     ok: bool = Field(description="Покрывает ли набор карточек документ")
     class MissingItem(BaseModel):
         what: str = Field(description="Что именно отсутствует/потерялось в карточках")
@@ -224,6 +581,95 @@ class JudgeResult(BaseModel):
     suggested_card_titles: list[str] = Field(default_factory=list, description="Какие карточки добавить (заголовки)")
 
 
+class MultiWriterResult(BaseModel):
+    """Карточки по нескольким документам сразу, по имени файла каждого."""
+
+    results: dict[str, WriterResult] = Field(
+        description="Карточки по каждому документу: ключ — имя файла документа, значение — его карточки"
+    )
+
+
+class WriterJudgeResult(BaseModel):
+    """Карточки документа и самопроверка их полноты по правилам судьи."""
+
+    cards: list[CardDraft] = Field(description="Список карточек (1..20)")
+    self_judge: JudgeResult = Field(description="Самопроверка: покрывают ли эти карточки весь документ")
+
+
+_JUDGE_EVIDENCE_RULES = (
+    "КРИТИЧЕСКОЕ ПРАВИЛО ПРО missing:\n"
+    "- Ты имеешь право добавить пункт в missing ТОЛЬКО если можешь привести ДОСЛОВНУЮ цитату из ORIGINAL DOCUMENT.\n"
+    "- Поле missing[].evidence должно быть точной подстрокой из ORIGINAL DOCUMENT (не пересказом).\n"
+    "- Если ты не можешь привести дословную цитату — НЕ добавляй этот пункт в missing.\n"
+    "- Запрещено требовать информацию, которой нет в ORIGINAL DOCUMENT.\n\n"
+)
+
+
+# Статичные части промптов стоят В НАЧАЛЕ: префикс запроса побайтно одинаков для всех документов
+# (и при смене роли), так провайдер может переиспользовать его кэш; всё переменное идёт после.
+_WRITER_PREAMBLE = (
+    "Ты создаёшь карточки знаний по одному документу.\n"
+    "ВАЖНО: НЕЛЬЗЯ добавлять/додумывать информацию, которой нет в документе.\n"
+    "Разрешено только: извлекать и структурировать. НЕ сжимай смысл: сохраняй все существенные детали.\n"
+    "Не переписывай документ целиком, но сохраняй семантические блоки (разделы/подразделы/списки/инструкции) и порядок внутри блока.\n"
+    "В заголовках и описании карточек обязательно отражай конкретный объект/инструмент из документа/имени файла (например SmartView), не пиши общие формулировки.\n"
+    "Важно: карточек может быть МНОГО, если документ большой и содержит разные смысловые блоки.\n"
+    "Ключевое правило: НЕ повторяй одну и ту же информацию в разных карточках. Каждый факт/инструкция/список должен жить в ОДНОЙ, "
+    "самой подходящей карточке. Если нужно упомянуть связь — сделай короткую ссылку 'см. карточку <название>' вместо копипаста.\n"
+    "Рекомендация по СМЫСЛОВЫМ типам информации (это не шаблон и не обязательные названия секций, а ориентир что покрывать):\n"
+    "- инструкции/процедуры/шаги\n"
+    "- инструменты/утилиты/сервисы\n"
+    "- модели/алгоритмы (если есть)\n"
+    "- цели и задачи (если есть)\n"
+    "- люди/контакты/ответственные (если есть)\n"
+    "- ограничения/условия доступа/сегменты сети/окружение\n"
+    "- сущности и ссылки (репозитории/отчеты/страницы)\n\n"
+    "Запрещено писать в карточке мета-текст и оценку качества, например: "
+    "'требует дополнительного пояснения', 'нужно подробнее описать', 'недостаточно информации'. "
+    "Если в документе деталей нет — просто НЕ добавляй их.\n"
+    "Важно: карточек может быть несколько или много.\n"
+    "Обычно достаточно 1-6 карточек на документ, но делай больше, если информации реально много и она распадается на разные темы.\n"
+    "Карточка должна быть самодостаточной.\n\n"
+    "Верни результат СТРОГО в JSON формате.\n\n"
+    "Правила:\n"
+    "- cards: 1..20 элементов.\n"
+    "- title: короткий заголовок карточки.\n"
+    "- description: 1–2 предложения, ОБЯЗАТЕЛЬНО начинай с фразы 'Документ содержит информацию о ...' и упомяни конкретный объект (например SmartView).\n"
+    "- content_md: markdown с фактами/инструкциями/списками. Включай ТОЛЬКО то, что есть в документе.\n"
+    "- key_terms: 5–25 терминов.\n"
+    "- entities: люди/организации/продукты/библиотеки/сервисы/репозитории.\n\n"
+)
+
+
+# Сколько документа отдаём в промпт писателя/судьи: ~5000 токенов (≈15000 символов кириллицы)
+_DOC_MAX_TOKENS = 5000
+_CHARS_PER_TOKEN = 3
+
+
+@functools.lru_cache(maxsize=1)
+def _token_encoding() -> Any:
+    if tiktoken is None:
+        return None
+    try:
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception:
+        # словарь не скачать (офлайн) — считаем по символам
+        return None
+
+
+def _truncate_to_tokens(text: str, max_tokens: int = _DOC_MAX_TOKENS) -> str:
+    """
+    Обрезает документ для промпта по числу токенов (с tiktoken) или по оценке `_CHARS_PER_TOKEN` символов на токен.
+    """
+    enc = _token_encoding()
+    if enc is None:
+        return text[: max_tokens * _CHARS_PER_TOKEN]
+    tokens = enc.encode(text, disallowed_special=())
+    if len(tokens) <= max_tokens:
+        return text
+    return enc.decode(tokens[:max_tokens])
+
+
 def _writer_prompt(
     ctx: ToolContext,
     *,
@@ -231,72 +677,93 @@ def _writer_prompt(
     doc_text: str,
     guidance: str | None = None,
     existing_cards_json: str | None = None,
+    self_judge: bool = False,
 ) -> str:
     """
     "Агент-писатель": предлагает разбиение документа на несколько карточек.
+    С `self_judge=True` он же сразу проверяет покрытие документа (поле self_judge, правила судьи).
     """
     return (
-        f"РОЛЬ: {ctx.role}\n\n"
+        _WRITER_PREAMBLE
+        + f"РОЛЬ: {ctx.role}\n\n"
         f"Вот название документа (имя файла): {origin_rel_path}\n"
         "Это имя относится к текущему документу-источнику и задаёт контекст (о каком конкретно инструменте/системе/теме документ).\n\n"
-        "Ты создаёшь карточки знаний по одному документу.\n"
-        "ВАЖНО: НЕЛЬЗЯ добавлять/додумывать информацию, которой нет в документе.\n"
-        "Разрешено только: извлекать и структурировать. НЕ сжимай смысл: сохраняй все существенные детали.\n"
-        "Не переписывай документ целиком, но сохраняй семантические блоки (разделы/подразделы/списки/инструкции) и порядок внутри блока.\n"
-        "В заголовках и описании карточек обязательно отражай конкретный объект/инструмент из документа/имени файла (например SmartView), не пиши общие формулировки.\n"
-        "Важно: карточек может быть МНОГО, если документ большой и содержит разные смысловые блоки.\n"
-        "Ключевое правило: НЕ повторяй одну и ту же информацию в разных карточках. Каждый факт/инструкция/список должен жить в ОДНОЙ, "
-        "самой подходящей карточке. Если нужно упомянуть связь — сделай короткую ссылку 'см. карточку <название>' вместо копипаста.\n"
-        "Рекомендация по СМЫСЛОВЫМ типам информации (это не шаблон и не обязательные названия секций, а ориентир что покрывать):\n"
-        "- инструкции/процедуры/шаги\n"
-        "- инструменты/утилиты/сервисы\n"
-        "- модели/алгоритмы (если есть)\n"
-        "- цели и задачи (если есть)\n"
-        "- люди/контакты/ответственные (если есть)\n"
-        "- ограничения/условия доступа/сегменты сети/окружение\n"
-        "- сущности и ссылки (репозитории/отчеты/страницы)\n\n"
-        "Запрещено писать в карточке мета-текст и оценку качества, например: "
-        "'требует дополнительного пояснения', 'нужно подробнее описать', 'недостаточно информации'. "
-        "Если в документе деталей нет — просто НЕ добавляй их.\n"
-        "Важно: карточек может быть несколько или много.\n"
-        "Обычно достаточно 1-6 карточек на документ, но делай больше, если информации реально много и она распадается на разные темы.\n"
-        "Карточка должна быть самодостаточной.\n\n"
-        "Верни результат СТРОГО в JSON формате.\n\n"
-        "Правила:\n"
-        "- cards: 1..20 элементов.\n"
-        "- title: короткий заголовок карточки.\n"
-        "- description: 1–2 предложения, ОБЯЗАТЕЛЬНО начинай с фразы 'Документ содержит информацию о ...' и упомяни конкретный объект (например SmartView).\n"
-        "- content_md: markdown с фактами/инструкциями/списками. Включай ТОЛЬКО то, что есть в документе.\n"
-        "- key_terms: 5–25 терминов.\n"
-        "- entities: люди/организации/продукты/библиотеки/сервисы/репозитории.\n\n"
         + (f"Уточнения/что НЕ хватает по мнению судьи:\n{guidance}\n\n" if guidance else "")
         + (f"Текущие карточки (если нужно — дополни, не дублируй):\n{existing_cards_json}\n\n" if existing_cards_json else "")
+        + (
+            (
+                "После карточек проверь себя как судья и заполни self_judge: отражены ли ВСЕ важные знания "
+                "из документа (ORIGINAL DOCUMENT) в твоих карточках.\n" + _JUDGE_EVIDENCE_RULES
+            )
+            if self_judge
+            else ""
+        )
         + "Документ (если длинный — работай по главному, но сохрани все важные сущности/ссылки/инструкции):\n\n"
-        f"{doc_text[:15000]}\n"
+        f"{doc_text}\n"
     )
 
 
+def _writer_prompt_multi(ctx: ToolContext, docs: list[tuple[str, str]]) -> str:
+    """
+    "Агент-писатель" сразу по нескольким коротким документам (origin_rel_path, doc_text) — один запрос вместо N.
+    """
+    return (
+        _WRITER_PREAMBLE
+        + f"РОЛЬ: {ctx.role}\n\n"
+        "Ниже несколько НЕЗАВИСИМЫХ документов. Для КАЖДОГО документа отдельно выполни задачу выше; "
+        "карточки разных документов не смешивай. Имя файла документа задаёт его контекст "
+        "(о каком конкретно инструменте/системе/теме документ).\n\n"
+        "Ответ: объект results, где ключ — имя файла документа (ровно как в строке '=== DOCUMENT: ... ==='), "
+        "значение — объект с cards для этого документа. Должны быть ВСЕ документы.\n\n"
+        + "".join(f"=== DOCUMENT: {rel} ===\n{text}\n=== END DOCUMENT ===\n\n" for rel, text in docs)
+    )
+
+
+def _pack_docs(docs: list[tuple[str, str]], budget: int) -> list[list[int]]:
+    """
+    Жадно группирует индексы документов по порядку так, чтобы суммарная длина группы не превышала `budget`.
+    Документ длиннее бюджета всегда идёт отдельной группой.
+    """
+    groups: list[list[int]] = []
+    cur: list[int] = []
+    cur_len = 0
+    for i, (_, text) in enumerate(docs):
+        n = len(text)
+        if budget <= 0 or n > budget:
+            groups.append([i])
+            continue
+        if cur and cur_len + n > budget:
+            groups.append(cur)
+            cur, cur_len = [], 0
+        cur.append(i)
+        cur_len += n
+    if cur:
+        groups.append(cur)
+    return groups
+
+
+_JUDGE_PREAMBLE = (
+    "Ты судья качества разбиения документа на карточки знаний.\n"
+    "У тебя есть ДВА входа:\n"
+    "- ORIGINAL DOCUMENT: исходный текст. Это ЕДИНСТВЕННЫЙ источник истины.\n"
+    "- CARDS_JSON: сгенерированные карточки, которые надо проверить.\n\n"
+    "Проверь: отражены ли ВСЕ важные знания из ORIGINAL DOCUMENT в CARDS_JSON.\n"
+    "Важно: карточки должны быть по смыслу (атомарные знания), не обязаны повторять структуру документа.\n"
+    "Также проверь, что карточки НЕ слишком раздроблены: если много однотипных мелких карточек, предложи объединить в 1–2 обзорные.\n\n"
+    + _JUDGE_EVIDENCE_RULES
+    + "Верни результат СТРОГО в JSON формате.\n\n"
+)
+
+
 def _judge_prompt(*, origin_rel_path: str, doc_text: str, cards_json: str) -> str:
     """
     "Агент-судья": проверяет, покрывают ли карточки весь документ.
     """
     return (
-        "Ты судья качества разбиения документа на карточки знаний.\n"
-        f"Название документа (имя файла): {origin_rel_path}\n\n"
-        "У тебя есть ДВА входа:\n"
-        "- ORIGINAL DOCUMENT: исходный текст. Это ЕДИНСТВЕННЫЙ источник истины.\n"
-        "- CARDS_JSON: сгенерированные карточки, которые надо проверить.\n\n"
-        "Проверь: отражены ли ВСЕ важные знания из ORIGINAL DOCUMENT в CARDS_JSON.\n"
-        "Важно: карточки должны быть по смыслу (атомарные знания), не обязаны повторять структуру документа.\n"
-        "Также проверь, что карточки НЕ слишком раздроблены: если много однотипных мелких карточек, предложи объединить в 1–2 обзорные.\n\n"
-        "КРИТИЧЕСКОЕ ПРАВИЛО ПРО missing:\n"
-        "- Ты имеешь право добавить пункт в missing ТОЛЬКО если можешь привести ДОСЛОВНУЮ цитату из ORIGINAL DOCUMENT.\n"
-        "- Поле missing[].evidence должно быть точной подстрокой из ORIGINAL DOCUMENT (не пересказом).\n"
-        "- Если ты не можешь привести дословную цитату — НЕ добавляй этот пункт в missing.\n"
-        "- Запрещено требовать информацию, которой нет в ORIGINAL DOCUMENT.\n\n"
-        "Верни результат СТРОГО в JSON формате.\n\n"
+        _JUDGE_PREAMBLE
+        + f"Название документа (имя файла): {origin_rel_path}\n\n"
         "=== ORIGINAL DOCUMENT (source of truth) ===\n"
-        f"{doc_text[:15000]}\n"
+        f"{doc_text}\n"
         "=== END ORIGINAL DOCUMENT ===\n\n"
         "=== CARDS_JSON (to evaluate) ===\n"
         f"{cards_json}\n"
@@ -308,6 +775,27 @@ def _normalize_ws(s: str) -> str:
     return " ".join((s or "").split())
 
 
+# с этого числа цитат один проход автоматом Ахо-Корасик дешевле, чем поиск каждой подстроки
+_AHOCORASICK_MIN_ITEMS = 4
+
+
+def _evidence_in_doc(doc_norm: str, evidences: list[str]) -> list[bool]:
+    """
+    Для каждой (нормализованной) цитаты: встречается ли она в нормализованном документе.
+    """
+    if ahocorasick is not None and len(evidences) >= _AHOCORASICK_MIN_ITEMS:
+        words = {ev for ev in evidences if ev}
+        if not words:
+            return [False] * len(evidences)
+        automaton = ahocorasick.Automaton()
+        for ev in words:
+            automaton.add_word(ev, ev)
+        automaton.make_automaton()
+        found = {ev for _, ev in automaton.iter(doc_norm)}
+        return [bool(ev) and ev in found for ev in evidences]
+    return [bool(ev) and ev in doc_norm for ev in evidences]
+
+
 def _sanitize_judge_meta(*, doc_text: str, judge_meta: dict[str, Any]) -> dict[str, Any]:
     """
     Защита от галлюцинаций судьи:
@@ -322,13 +810,16 @@ def _sanitize_judge_meta(*, doc_text: str, judge_meta: dict[str, Any]) -> dict[s
         missing_in = []
 
     doc_norm = _normalize_ws(doc_text)
+    evidences = [
+        _normalize_ws(str(item.get("evidence", "") or "")) for item in missing_in if isinstance(item, dict)
+    ]
+    found = iter(_evidence_in_doc(doc_norm, evidences))
 
     kept: list[Any] = []
     removed_count = 0
     for item in missing_in:
         if isinstance(item, dict):
-            ev = str(item.get("evidence", "") or "").strip()
-            if ev and _normalize_ws(ev) in doc_norm:
+            if next(found):
                 kept.append(item)
             else:
                 removed_count += 1
@@ -358,7 +849,7 @@ def _generate_cards_once(
     guidance: str | None = None,
     existing_cards: list[dict[str, Any]] | None = None,
 ) -> list[dict[str, Any]]:
-    existing_json = json.dumps({"cards": existing_cards or []}, ensure_ascii=False) if existing_cards else None
+    existing_json = _dumps({"cards": existing_cards}) if existing_cards else None
     writer = _writer_prompt(
         ctx,
         origin_rel_path=origin_rel_path,
@@ -370,11 +861,68 @@ def _generate_cards_once(
     return [c.model_dump() for c in writer_out.cards]
 
 
+def _generate_and_judge_once(
+    ctx: ToolContext, *, origin_rel_path: str, doc_text: str
+) -> tuple[list[dict[str, Any]], dict[str, Any]]:
+    """
+    Писатель + самопроверка одним вызовом LLM (ctx.fused_writer_judge).
+    """
+    prompt = _writer_prompt(ctx, origin_rel_path=origin_rel_path, doc_text=doc_text, self_judge=True)
+    out = _llm_parse_pydantic(ctx, prompt=prompt, model=WriterJudgeResult, attempts=3)
+    return [c.model_dump() for c in out.cards], out.self_judge.model_dump()
+
+
+def _generate_cards_many(
+    ctx: ToolContext, docs: list[tuple[str, str]]
+) -> list[tuple[list[dict[str, Any]], dict[str, Any] | None]]:
+    """
+    Первый прогон писателя сразу по многим документам (origin_rel_path, doc_text) — одним пакетом.
+    Короткие документы упаковываются по несколько в один запрос (ctx.multi_doc_chars).
+    Возвращает (cards, judge_meta) на документ; judge_meta есть только в режиме ctx.fused_writer_judge.
+    Для документов, по которым ответ не получен, cards — пустой список.
+    """
+    fused = bool(ctx.fused_writer_judge)
+    out: list[tuple[list[dict[str, Any]], dict[str, Any] | None]] = [([], None)] * len(docs)
+    # самопроверка делается по одному документу, поэтому в fused-режиме не упаковываем
+    groups = [[i] for i in range(len(docs))] if fused else _pack_docs(docs, int(ctx.multi_doc_chars))
+
+    def _single_job(i: int) -> tuple[str, type[BaseModel]]:
+        rel, text = docs[i]
+        prompt = _writer_prompt(ctx, origin_rel_path=rel, doc_text=text, self_judge=fused)
+        return prompt, (WriterJudgeResult if fused else WriterResult)
+
+    jobs = [
+        _single_job(g[0]) if len(g) == 1 else (_writer_prompt_multi(ctx, [docs[i] for i in g]), MultiWriterResult)
+        for g in groups
+    ]
+    retry: list[int] = []
+    for g, r in zip(groups, _llm_parse_pydantic_many(ctx, jobs=jobs, attempts=3)):
+        if len(g) == 1:
+            if r is not None:
+                judge = r.self_judge.model_dump() if fused else None
+                out[g[0]] = ([c.model_dump() for c in r.cards], judge)
+            continue
+        by_rel = r.results if r is not None else {}
+        for i in g:
+            res = by_rel.get(docs[i][0])
+            if res is not None and res.cards:
+                out[i] = ([c.model_dump() for c in res.cards], None)
+            else:
+                retry.append(i)
+
+    # документы, потерянные в общем ответе, — вторым пакетом, уже по одному на запрос
+    if retry:
+        for i, r in zip(retry, _llm_parse_pydantic_many(ctx, jobs=[_single_job(i) for i in retry], attempts=3)):
+            if r is not None:
+                out[i] = ([c.model_dump() for c in r.cards], None)
+    return out
+
+
 def _judge_once(ctx: ToolContext, *, origin_rel_path: str, doc_text: str, cards: list[dict[str, Any]]) -> dict[str, Any]:
     """
     Судья вызывается ОДИН раз на документ и получает все карточки документа.
     """
-    judge_in = json.dumps({"cards": cards}, ensure_ascii=False)
+    judge_in = _dumps({"cards": cards})
     try:
         judge_out = _llm_parse_pydantic(
             ctx,
@@ -391,72 +939,109 @@ def _judge_once(ctx: ToolContext, *, origin_rel_path: str, doc_text: str, cards:
 _FALLBACK_MARKER = "Краткое описание не сгенерировано"
 
 
+# Запрещённые мета-комментарии (карточка должна содержать факты, а не "нужно подробнее")
+_BAD_PHRASES = (
+    "требует дополнительного пояснения",
+    "требуют дополнительного пояснения",
+    "необходимо подробнее описать",
+    "нужно подробнее описать",
+    "представлены кратко и требуют",
+    "требует доработки",
+    "нуждается в доработке",
+    "недостаточно информации",
+    "требует дополнительного уточнения",
+)
+# все фразы одним regex: один проход по тексту вместо отдельного поиска на каждую
+_BAD_PHRASE_RE = re.compile("|".join(re.escape(p) for p in _BAD_PHRASES), re.IGNORECASE)
+
+
 def _cards_have_generation_error(cards: list[dict[str, Any]]) -> bool:
     for c in cards:
-        if _FALLBACK_MARKER in str(c.get("description", "")) or _FALLBACK_MARKER in str(c.get("content_md", "")):
+        description = str(c.get("description", ""))
+        content_md = str(c.get("content_md", ""))
+        if _FALLBACK_MARKER in description or _FALLBACK_MARKER in content_md:
             return True
-        # Запрещённые мета-комментарии (карточка должна содержать факты, а не "нужно подробнее")
-        bad_phrases = [
-            "требует дополнительного пояснения",
-            "требуют дополнительного пояснения",
-            "необходимо подробнее описать",
-            "нужно подробнее описать",
-            "представлены кратко и требуют",
-            "требует доработки",
-            "нуждается в доработке",
-            "недостаточно информации",
-            "требует дополнительного уточнения",
-        ]
-        text = (str(c.get("description", "")) + "\n" + str(c.get("content_md", ""))).lower()
-        if any(p in text for p in bad_phrases):
+        if _BAD_PHRASE_RE.search(description) or _BAD_PHRASE_RE.search(content_md):
             return True
     return False
 
-def kb_upsert_cards_for_markdown(ctx: ToolContext, origin_rel_path: str, force: bool = False) -> dict[str, Any]:
+
+def kb_upsert_cards_for_markdown(
+    ctx: ToolContext,
+    origin_rel_path: str,
+    force: bool = False,
+    *,
+    scan: MarkdownScan | None = None,
+    first_pass: tuple[list[dict[str, Any]], dict[str, Any] | None] | None = None,
+    card_files: list[Path] | None = None,
+    prompt_text: str | None = None,
+) -> dict[str, Any]:
     if not origin_rel_path:
         raise ValueError("origin_rel_path is required")
     md_path = _resolve_origin(ctx, origin_rel_path)
-    md_text = md_path.read_text(encoding="utf-8")
-    md_hash = file_sha256(md_path)
-    md_stat = md_path.stat()
-    md_mtime = datetime.fromtimestamp(md_stat.st_mtime, tz=timezone.utc).isoformat()
+    if scan is None:
+        scan, _ = _scan_origin(ctx, origin_rel_path, md_path)
+    md_text = scan.text
+    md_hash = scan.sha256
 
-    # Очистка старых markdown-карточек по этому документу
+    # Карточки уже собраны из этой версии документа — ничего не удаляем и не зовём LLM
     stem = Path(origin_rel_path).stem
     ctx.kb.cards_md_dir.mkdir(parents=True, exist_ok=True)
-    for p in ctx.kb.cards_md_dir.glob(f"card_*_{stem}.md"):
-        try:
-            p.unlink()
-        except Exception:
-            pass
-
-    title = extract_title(md_text, fallback=Path(origin_rel_path).stem)
-    now = utc_now_iso()
+    # то же точное правило сопоставления, что в kb_sync_all/coverage: glob card_*_b.md задел бы и card_<id>_a_b.md
+    old_card_files = _card_files_by_stem(ctx).get(stem, []) if card_files is None else card_files
+    if not force and _cards_up_to_date(old_card_files, md_hash):
+        return {
+            "ok": True,
+            "skipped": True,
+            "origin": origin_rel_path,
+            "cards_md_count": len(old_card_files),
+            "cards_md_files": [p.as_posix() for p in old_card_files],
+            "quality": None,
+        }
+
+    # одна обрезанная копия документа на писателя, судью и доработку (kb_sync_all передаёт уже готовую)
+    if prompt_text is None:
+        prompt_text = _truncate_to_tokens(md_text)
+    title = scan.title
     quality: dict[str, Any] | None = None
+    cached = None if force else _cached_cards(ctx, origin_rel_path, md_hash)
 
     # 1) Генерация карточек (писатель)
     raw_cards: list[dict[str, Any]] = []
-    try:
-        raw_cards = _generate_cards_once(ctx, origin_rel_path=origin_rel_path, doc_text=md_text)
-    except Exception:
-        raw_cards = []
+    # оценка судьи, если она уже пришла вместе с карточками (ctx.fused_writer_judge)
+    judge_meta: dict[str, Any] | None = None
+    if cached is not None:
+        # тот же документ и та же роль уже обработаны в этом процессе
+        raw_cards, quality = cached
+    elif first_pass is not None:
+        # уже посчитано пакетом в kb_sync_all
+        raw_cards, judge_meta = first_pass
+    elif ctx.fused_writer_judge:
+        try:
+            raw_cards, judge_meta = _generate_and_judge_once(ctx, origin_rel_path=origin_rel_path, doc_text=prompt_text)
+        except Exception:
+            raw_cards = []
+    else:
+        try:
+            raw_cards = _generate_cards_once(ctx, origin_rel_path=origin_rel_path, doc_text=prompt_text)
+        except Exception:
+            raw_cards = []
 
     # 2) Если в карточках маркер ошибки — один раз повторяем прогон документа
-    if not raw_cards or _cards_have_generation_error(raw_cards):
+    if cached is None and (not raw_cards or _cards_have_generation_error(raw_cards)):
+        judge_meta = None  # самопроверка относилась к отброшенным карточкам
         try:
-            # небольшая дополнительная пауза перед повтором
-            if ctx.request_delay_s:
-                time.sleep(float(ctx.request_delay_s))
             raw_cards = _generate_cards_once(
                 ctx,
                 origin_rel_path=origin_rel_path,
-                doc_text=md_text,
+                doc_text=prompt_text,
                 guidance="Предыдущая попытка содержала ошибку генерации. Верни корректные карточки.",
             )
         except Exception:
             raw_cards = []
 
-    if not raw_cards:
+    fallback = not raw_cards
+    if fallback:
         raw_cards = [
             {
                 "title": title,
@@ -467,9 +1052,10 @@ def kb_upsert_cards_for_markdown(ctx: ToolContext, origin_rel_path: str, force:
             }
         ]
         quality = {"judge": {"ok": False, "missing": ["Ошибка генерации/парсинга/сети"], "suggested_card_titles": []}}
-    else:
-        # 3) Судья (ОДНА итерация) — оцениваем исходный набор карточек
-        judge_meta = _judge_once(ctx, origin_rel_path=origin_rel_path, doc_text=md_text, cards=raw_cards)
+    elif cached is None:
+        # 3) Судья (ОДНА итерация) — оцениваем исходный набор карточек (в fused-режиме оценка уже есть)
+        if judge_meta is None:
+            judge_meta = _judge_once(ctx, origin_rel_path=origin_rel_path, doc_text=prompt_text, cards=raw_cards)
         judge_meta = _sanitize_judge_meta(doc_text=md_text, judge_meta=judge_meta)
         quality = {"judge": judge_meta}
 
@@ -502,7 +1088,7 @@ def kb_upsert_cards_for_markdown(ctx: ToolContext, origin_rel_path: str, force:
                 refined = _generate_cards_once(
                     ctx,
                     origin_rel_path=origin_rel_path,
-                    doc_text=md_text,
+                    doc_text=prompt_text,
                     guidance=guidance,
                     existing_cards=raw_cards,
                 )
@@ -516,29 +1102,38 @@ def kb_upsert_cards_for_markdown(ctx: ToolContext, origin_rel_path: str, force:
                 quality["refinement_error"] = f"{type(e).__name__}"
         else:
             quality["refinement_applied"] = False
+        _remember_cards(ctx, origin_rel_path, md_hash, raw_cards, quality)
+
+    # Старые карточки удаляем только сейчас: если генерация упала с исключением, они остаются на месте
+    for p in old_card_files:
+        try:
+            p.unlink()
+        except Exception:
+            pass
 
     md_dir = ctx.kb.cards_md_dir
-    md_dir.mkdir(parents=True, exist_ok=True)
     source_stem = Path(origin_rel_path).stem
-    created_files: list[str] = []
+    source_ref = f"{ctx.kb.origins_dir.name}/{origin_rel_path}"
+    # У карточки-заглушки нет source_sha256: иначе документ считался бы актуальным и после сбоя сети
+    # больше не перегенерировался бы (coverage покажет его как stale)
+    source_marker = (
+        f"<!-- source: {source_ref} -->\n" if fallback else f"<!-- source: {source_ref} source_sha256: {md_hash} -->\n"
+    )
+    # Сначала собираем все файлы в памяти, потом пишем подряд: карточек у документа немного,
+    # а документы и так обрабатываются параллельно в kb_sync_all
+    files: list[tuple[Path, bytes]] = []
     for idx, rc in enumerate(raw_cards):
         t = str(rc.get("title", "")).strip() or f"{title} — часть {idx+1}"
         description = str(rc.get("description", "")).strip()
         if description and not description.lower().startswith("документ содержит информацию о"):
             description = f"Документ содержит информацию о {description.rstrip('.') }."
         content_md = str(rc.get("content_md", "")).strip()
-        key_terms = [str(x).strip() for x in (rc.get("key_terms") or []) if str(x).strip()]
-        entities = [str(x).strip() for x in (rc.get("entities") or []) if str(x).strip()]
-        card_id = sha256(f"{origin_rel_path}:{md_hash}:{idx}:{t}".encode("utf-8")).hexdigest()[:12]
-        md_filename = f"card_{card_id}_{source_stem}.md"
-        md_path = md_dir / md_filename
-        md_body = (
-            f"-- {description} --\n\n"
-            f"{content_md}\n\n"
-            f"<!-- source: {ctx.kb.origins_dir.name}/{origin_rel_path} source_sha256: {md_hash} -->\n"
-        )
-        md_path.write_text(md_body, encoding="utf-8")
-        created_files.append(md_path.as_posix())
+        card_id = blake2b(f"{origin_rel_path}:{md_hash}:{idx}:{t}".encode("utf-8"), digest_size=6).hexdigest()
+        md_body = f"-- {description} --\n\n{content_md}\n\n{source_marker}"
+        files.append((md_dir / f"card_{card_id}_{source_stem}.md", md_body.encode("utf-8")))
+    for path, data in files:
+        path.write_bytes(data)
+    created_files = [path.as_posix() for path, _ in files]
 
     return {
         "ok": True,
@@ -552,11 +1147,62 @@ def kb_upsert_cards_for_markdown(ctx: ToolContext, origin_rel_path: str, force:
 
 def kb_sync_all(ctx: ToolContext, force: bool = False) -> dict[str, Any]:
     md_files = _list_markdown_files(ctx)
-    results = []
-    for md in md_files:
-        rel = _origin_rel(ctx, md)
-        results.append(kb_upsert_cards_for_markdown(ctx, rel, force=force))
-    return {"ok": True, "processed": len(md_files), "results": results}
+    rels = [_origin_rel(ctx, md) for md in md_files]
+    # Чтение + sha256 всех документов заранее и параллельно; дальше — только LLM и запись
+    scans = _scan_origins(ctx, list(zip(rels, md_files)))
+    # Неизменённые документы (карточки на диске или в кэше процесса) в LLM не отправляем вовсе
+    card_index = _card_files_by_stem(ctx)
+    cards_of = [card_index.get(Path(rel).stem, []) for rel in rels]
+    pending = [
+        i
+        for i, (rel, scan) in enumerate(zip(rels, scans))
+        if isinstance(scan, MarkdownScan)
+        and (
+            force
+            or (
+                _cached_cards(ctx, rel, scan.sha256) is None
+                and not _cards_up_to_date(cards_of[i], scan.sha256)
+            )
+        )
+    ]
+    # Первый прогон писателя по остальным документам — одним llm.batch вместо N последовательных вызовов
+    # документ обрезается для промптов один раз: этот же текст уходит и в пакет, и в upsert
+    prompt_texts: list[str | None] = [None] * len(rels)
+    for i in pending:
+        prompt_texts[i] = _truncate_to_tokens(scans[i].text)
+    drafts: list[tuple[list[dict[str, Any]], dict[str, Any] | None] | None] = [None] * len(rels)
+    for i, draft in zip(pending, _generate_cards_many(ctx, [(rels[i], prompt_texts[i]) for i in pending])):
+        drafts[i] = draft
+
+    def _one(
+        rel: str,
+        scan: MarkdownScan | Exception,
+        first_pass: tuple[list[dict[str, Any]], dict[str, Any] | None] | None,
+        card_files: list[Path],
+        prompt_text: str | None,
+    ) -> dict[str, Any]:
+        # ошибка одного документа (в т.ч. при чтении) не должна отменять остальные
+        if isinstance(scan, Exception):
+            return {"ok": False, "origin": rel, "error": f"{type(scan).__name__}: {scan}"}
+        try:
+            return kb_upsert_cards_for_markdown(
+                ctx,
+                rel,
+                force=force,
+                scan=scan,
+                first_pass=first_pass,
+                card_files=card_files,
+                prompt_text=prompt_text,
+            )
+        except Exception as e:
+            return {"ok": False, "origin": rel, "error": f"{type(e).__name__}: {e}"}
+
+    # Документы независимы и упираются в сетевые вызовы LLM — обрабатываем их пулом потоков.
+    # pool.map отдаёт результаты в порядке подачи, так что вывод детерминирован.
+    workers = max(1, min(int(ctx.parallelism), len(rels) or 1))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(_one, rels, scans, drafts, cards_of, prompt_texts))
+    return {"ok": all(r.get("ok") for r in results), "processed": len(md_files), "results": results}
 
 
 class ReadDirectoryArgs(BaseModel):
@@ -0,0 +1,55 @@
+from __future__ import annotations
+
+import pytest
+from langchain_core.runnables import RunnableLambda
+
+from kb_agent.config import KBPaths
+from kb_agent.tools import (
+    JudgeResult,
+    MultiWriterResult,
+    ToolContext,
+    WriterJudgeResult,
+    WriterResult,
+    _invoke_structured,
+    _structured_llm,
+)
+
+RESPONSE_MODELS = [WriterResult, JudgeResult, MultiWriterResult, WriterJudgeResult]
+
+
+def _ctx(tmp_path, chat_model) -> ToolContext:
+    root = tmp_path / "knowledge_base"
+    kb = KBPaths(root=root, origins_dir=root / "origins", cards_dir=root / "cards", cards_md_dir=root / "cards_md")
+    return ToolContext(kb=kb, llm=RunnableLambda(lambda p: p), chat_model=chat_model)
+
+
+@pytest.mark.parametrize("model", RESPONSE_MODELS, ids=lambda m: m.__name__)
+def test_gigachat_builds_structured_output(tmp_path, model):
+    # GigaChat требует описание функции: без docstring у модели ответа with_structured_output падает
+    langchain_gigachat = pytest.importorskip("langchain_gigachat")
+    chat = langchain_gigachat.GigaChat(credentials="test", verify_ssl_certs=False)
+    ctx = _ctx(tmp_path, chat)
+    assert ctx.structured_output
+    assert _structured_llm(ctx, model) is not None
+    assert ctx.structured_output
+
+
+class _Unsupported:
+    def __init__(self) -> None:
+        self.calls = 0
+
+    def with_structured_output(self, model):
+        def run(prompt):
+            self.calls += 1
+            raise NotImplementedError
+
+        return RunnableLambda(run)
+
+
+def test_structured_output_disabled_after_unsupported_error(tmp_path):
+    chat = _Unsupported()
+    ctx = _ctx(tmp_path, chat)
+    assert _invoke_structured(ctx, "prompt", WriterResult) is None
+    assert ctx.structured_output is False
+    assert _invoke_structured(ctx, "prompt", WriterResult) is None
+    assert chat.calls == 1
@@ -0,0 +1,66 @@
+from __future__ import annotations
+
+import json
+from pathlib import Path
+
+from langchain_core.runnables import RunnableLambda
+
+from kb_agent.config import KBPaths
+from kb_agent.tools import ToolContext, kb_analyze_coverage, kb_sync_all
+
+_CARD = {"title": "T", "description": "Документ содержит информацию о X.", "content_md": "body"}
+
+
+def _fake_llm(prompt: str) -> str:
+    if "CARDS_JSON (to evaluate)" in prompt:
+        return json.dumps({"ok": True, "missing": [], "suggested_card_titles": []})
+    return json.dumps({"cards": [_CARD]})
+
+
+def _failing_llm(prompt: str) -> str:
+    raise ConnectionError("network down")
+
+
+def _ctx(root: Path, llm) -> ToolContext:
+    kb = KBPaths(root=root, origins_dir=root / "origins", cards_dir=root / "cards", cards_md_dir=root / "cards_md")
+    # multi_doc_chars=0: каждый документ отдельным запросом, как в простом случае
+    return ToolContext(kb=kb, llm=RunnableLambda(llm), multi_doc_chars=0)
+
+
+def _kb(tmp_path: Path) -> Path:
+    root = tmp_path / "knowledge_base"
+    (root / "origins").mkdir(parents=True)
+    (root / "cards_md").mkdir()
+    (root / "origins" / "doc.md").write_text("# Doc\n\nSome facts.\n", encoding="utf-8")
+    return root
+
+
+def test_fallback_cards_are_regenerated_on_next_sync(tmp_path):
+    root = _kb(tmp_path)
+
+    res = kb_sync_all(_ctx(root, _failing_llm))
+    assert res["results"][0]["quality"]["judge"]["ok"] is False
+    assert kb_analyze_coverage(_ctx(root, _fake_llm))["stale_cards_for_origins"] == ["doc.md"]
+
+    calls: list[str] = []
+
+    def _counting_llm(prompt: str) -> str:
+        calls.append(prompt)
+        return _fake_llm(prompt)
+
+    res = kb_sync_all(_ctx(root, _counting_llm))
+    assert res["results"][0]["skipped"] is False
+    assert calls
+    cards = list((root / "cards_md").glob("card_*_doc.md"))
+    assert len(cards) == 1
+    assert "source_sha256:" in cards[0].read_text(encoding="utf-8")
+    assert kb_analyze_coverage(_ctx(root, _fake_llm))["stale_cards_for_origins"] == []
+
+
+def test_unchanged_document_is_skipped_without_llm_calls(tmp_path):
+    root = _kb(tmp_path)
+    kb_sync_all(_ctx(root, _fake_llm))
+
+    res = kb_sync_all(_ctx(root, _failing_llm))
+    assert res["ok"] is True
+    assert res["results"][0]["skipped"] is True